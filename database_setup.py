@@ -11,12 +11,31 @@ Propósito: Configuración inicial de la base de datos para el sistema de pedido
 """
 
 import pandas as pd
+from pandas.io.parsers import TextParser
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import URL
 from sqlalchemy.exc import IntegrityError
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+import argparse
 import os
+import shutil
+import subprocess
+import threading
+
+try:
+    # Opcional: carga BCP para las tablas de hechos (requiere la utilidad bcp)
+    from bcpandas import SqlCreds, to_sql as bcp_to_sql
+except ImportError:
+    bcp_to_sql = None
+
+# Copy-on-write: las operaciones derivadas (drop, rename, ...) no duplican bloques
+# (en pandas >= 3.0 siempre está activo y la opción está obsoleta)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # Configuración de la base de datos - PERSONALIZAR SEGÚN TU ENTORNO
 DATABASE_CONFIG = {
@@ -27,12 +46,16 @@ DATABASE_CONFIG = {
     'driver': 'ODBC Driver 17 for SQL Server'
 }
 
+@lru_cache(maxsize=None)
 def create_connection():
     """
     Establece conexión con la base de datos SQL Server
     
     IMPORTANTE: Configurar DATABASE_CONFIG con tus credenciales antes de ejecutar
     
+    El engine se crea una sola vez y se reutiliza: su pool mantiene conexiones
+    abiertas para la carga en paralelo y la validación.
+    
     Returns:
         engine: SQLAlchemy engine object
     """
@@ -61,9 +84,261 @@ def create_connection():
         query={"odbc_connect": connection_string}
     )
     
-    engine = create_engine(connection_url)
+    # fast_executemany: pyodbc envía cada lote como un arreglo de parámetros
+    # pool: conexiones reutilizables (evita un login TLS por cada tabla)
+    engine = create_engine(
+        connection_url,
+        fast_executemany=True,
+        pool_size=8,
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
     return engine
 
+def create_bcp_credentials():
+    """
+    Construye las credenciales de bcpandas a partir de DATABASE_CONFIG
+    
+    Returns:
+        SqlCreds: Credenciales para la utilidad bcp
+    """
+    driver_version = int(''.join(c for c in DATABASE_CONFIG['driver'] if c.isdigit()) or 17)
+    return SqlCreds(
+        server=DATABASE_CONFIG['server'],
+        database=DATABASE_CONFIG['database'],
+        username=DATABASE_CONFIG['username'],
+        password=DATABASE_CONFIG['password'],
+        driver_version=driver_version
+    )
+
+def read_excel_data(excel_file, sheet_name):
+    """
+    Lee la hoja de datos del Excel usando el lector calamine (Rust) si está disponible
+    
+    Args:
+        excel_file: Ruta del archivo Excel
+        sheet_name: Nombre de la hoja a leer
+        
+    Returns:
+        DataFrame: Datos de la hoja con la segunda fila como encabezado
+    """
+    try:
+        return pd.read_excel(excel_file, sheet_name=sheet_name, header=1, engine='calamine')
+    except (ImportError, ValueError):
+        # pandas < 2.2 o python-calamine no instalado: usar openpyxl
+        return pd.read_excel(excel_file, sheet_name=sheet_name, header=1)
+
+def normalize_mixed_columns(df):
+    """
+    Convierte a texto las columnas con tipos mezclados (p. ej. teléfonos '0766...' y números)
+    
+    Parquet exige un tipo por columna; aplicarlo siempre hace que la lectura desde
+    el Excel y desde la caché devuelvan los mismos tipos.
+    
+    Args:
+        df: DataFrame leído del Excel
+        
+    Returns:
+        DataFrame: Datos con las columnas mezcladas como dtype 'string'
+    """
+    mixed_columns = [
+        column for column in df.columns
+        if pd.api.types.is_object_dtype(df[column])
+        and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')
+    ]
+    if not mixed_columns:
+        return df
+    return df.astype({column: 'string' for column in mixed_columns})
+
+def snapshot_cache_file(cache_file, snapshot_dir):
+    """
+    Guarda una instantánea fechada de la caché Parquet
+    
+    Usa cp --reflink=always (GNU coreutils): en btrfs/XFS/ZFS la copia comparte bloques
+    con el original y no ocupa espacio adicional. Si el sistema de archivos no admite
+    reflink (ext4, NTFS, ...) la instantánea se omite en lugar de hacer una copia completa.
+    
+    Args:
+        cache_file: Ruta del archivo Parquet de caché
+        snapshot_dir: Carpeta donde se guardan las instantáneas
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name, extension = os.path.splitext(os.path.basename(cache_file))
+    snapshot_file = os.path.join(snapshot_dir, f"{name}-{datetime.now():%Y%m%d%H%M%S}{extension}")
+    
+    try:
+        subprocess.run(
+            ['cp', '--reflink=always', cache_file, snapshot_file],
+            check=True,
+            capture_output=True
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        # Sin reflink o sin GNU cp (p. ej. Windows o macOS): omitir la instantánea
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+        print(f"   ⚠ Instantánea de {cache_file} omitida (requiere cp con reflink): {e}")
+
+def read_source_data(excel_file, sheet_name, cache_file, snapshot_dir=None):
+    """
+    Lee los datos de origen, reutilizando una caché Parquet si está vigente
+    
+    La caché se considera vigente si es más reciente que el archivo Excel.
+    
+    Args:
+        excel_file: Ruta del archivo Excel
+        sheet_name: Nombre de la hoja a leer
+        cache_file: Ruta del archivo Parquet de caché
+        snapshot_dir: Carpeta para instantáneas de cada caché nueva (None: no guardar)
+        
+    Returns:
+        DataFrame: Datos de la hoja
+    """
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) > os.path.getmtime(excel_file):
+        try:
+            return pd.read_parquet(cache_file)
+        except Exception as e:
+            print(f"   ⚠ Caché {cache_file} no legible, se relee el Excel: {e}")
+    
+    df = normalize_mixed_columns(read_excel_data(excel_file, sheet_name))
+    
+    try:
+        # Escritura atómica: una ejecución interrumpida no deja una caché a medias
+        partial_file = f"{cache_file}.tmp"
+        df.to_parquet(partial_file, compression='zstd')
+        os.replace(partial_file, cache_file)
+    except Exception as e:
+        # pyarrow no instalado o tipos no serializables: continuar sin caché
+        print(f"   ⚠ No se pudo guardar la caché {cache_file}: {e}")
+    else:
+        if snapshot_dir:
+            snapshot_cache_file(cache_file, snapshot_dir)
+    
+    return df
+
+def start_background_read(excel_file, sheet_name, cache_file, snapshot_dir=None):
+    """
+    Inicia read_source_data en un hilo daemon
+    
+    Al ser daemon, si la configuración falla y el script termina antes de usar
+    los datos, la salida no espera a que termine la lectura del Excel.
+    
+    Args:
+        excel_file: Ruta del archivo Excel
+        sheet_name: Nombre de la hoja a leer
+        cache_file: Ruta del archivo Parquet de caché
+        snapshot_dir: Carpeta para instantáneas de cada caché nueva (None: no guardar)
+        
+    Returns:
+        tuple: (hilo, resultado); tras join(), resultado tiene la clave 'df' o 'error'
+    """
+    outcome = {}
+    
+    def run():
+        try:
+            outcome['df'] = read_source_data(excel_file, sheet_name, cache_file, snapshot_dir)
+        except Exception as e:
+            outcome['error'] = e
+    
+    reader = threading.Thread(target=run, daemon=True)
+    reader.start()
+    return reader, outcome
+
+# Esquema de extracción: tabla -> (columnas del Excel, renombrado a columnas SQL)
+# La columna de ID de cada tabla es siempre f'id_{tabla}'
+TABLE_SCHEMAS = {
+    # 1. TIPO_DOCUMENTO - Tabla de referencia para tipos de documentos
+    'tipo_documento': (
+        ['id_tipo_documento', 'nombre', 'descripcion'],
+        {}
+    ),
+    # 2. CANAL_CLIENTE - Tipos de canales de venta
+    'canal_cliente': (
+        ['id_canal_cliente', 'nombre.1', 'descripcion.1'],
+        {'nombre.1': 'nombre', 'descripcion.1': 'descripcion'}
+    ),
+    # 3. TIPO_PAGO - Métodos de pago disponibles
+    'tipo_pago': (
+        ['id_tipo_pago', 'nombre_tipo_pago', 'descripcion.2'],
+        {'descripcion.2': 'descripcion'}
+    ),
+    # 4. CARGO_TRABAJADOR - Cargos del personal
+    'cargo_trabajador': (
+        ['id_cargo_trabajador', 'nombre.2', 'descripcion.4'],
+        {'nombre.2': 'nombre_cargo', 'descripcion.4': 'descripcion'}
+    ),
+    # 5. MARCA_PRODUCTO - Marcas de productos
+    'marca_producto': (
+        ['id_marca_producto', 'nombre_marca'],
+        {}
+    ),
+    # 6. CATEGORIA_PRODUCTO - Categorías de productos
+    'categoria_producto': (
+        ['id_categoria_producto', 'nombre_categoria', 'descripcion.5'],
+        {'descripcion.5': 'descripcion'}
+    ),
+    # 7. TRABAJADOR - Personal de la empresa
+    'trabajador': (
+        ['id_trabajador', 'nombre trabajador', 'correo', 'telefono.1', 'id_cargo_trabajador'],
+        {'nombre trabajador': 'nombres', 'correo': 'email', 'telefono.1': 'telefono'}
+    ),
+    # 8. CLIENTE - Base de clientes
+    'cliente': (
+        ['id_cliente', 'nombre_cliente', 'numero_documento', 'correo.1', 'telefono.2',
+         'direccion', 'id_tipo_documento', 'id_canal_cliente'],
+        {'correo.1': 'email', 'telefono.2': 'telefono'}
+    ),
+    # 9. PRODUCTO - Catálogo de productos
+    'producto': (
+        ['id_producto', 'descripcion.6', 'precio', 'id_marca_producto', 'id_categoria_producto'],
+        {'descripcion.6': 'descripcion'}
+    ),
+    # 10. PEDIDO - Órdenes de compra
+    'pedido': (
+        ['id_pedido', 'id_trabajador', 'id_cliente', 'id_tipo_pago', 'fecha', 'monto_total'],
+        {}
+    ),
+    # 11. DETALLE_PEDIDO - Líneas de cada pedido
+    'detalle_pedido': (
+        ['id_detalle_pedido', 'id_pedido', 'id_producto', 'cantidad', 'precio_unitario'],
+        {}
+    ),
+}
+
+# Columnas opcionales: se proyectan junto con la tabla solo si existen en el Excel
+TABLE_OPTIONAL_COLUMNS = {
+    'producto': {'codigo_formato_producto': 'id_formato_producto'},
+    'detalle_pedido': {'id_promocion': 'id_promocion'}
+}
+
+# Dependencias de foreign keys entre las tablas cargadas: tabla -> tablas padre
+TABLE_DEPENDENCIES = {
+    'tipo_documento': [],
+    'canal_cliente': [],
+    'tipo_pago': [],
+    'cargo_trabajador': [],
+    'marca_producto': [],
+    'categoria_producto': [],
+    'trabajador': ['cargo_trabajador'],
+    'cliente': ['tipo_documento', 'canal_cliente'],
+    'producto': ['marca_producto', 'categoria_producto'],
+    'pedido': ['trabajador', 'cliente', 'tipo_pago'],
+    'detalle_pedido': ['pedido', 'producto']
+}
+
+# Foreign keys hacia tablas que este script no carga: tabla -> {columna: tabla padre}.
+# Mientras la tabla padre no esté en TABLE_DEPENDENCIES, la columna se inserta como NULL:
+# con las foreign keys desactivadas durante la carga, un valor quedaría sin validar
+EXTERNAL_FOREIGN_KEYS = {
+    'producto': {'id_formato_producto': 'formato_producto'},
+    'detalle_pedido': {'id_promocion': 'promocion'}
+}
+
+# Tablas de referencia (sin foreign keys): se consolidan por ID con groupby().first()
+REFERENCE_TABLES = tuple(
+    table_name for table_name, parents in TABLE_DEPENDENCIES.items() if not parents
+)
+
 def extract_table_data(df):
     """
     Extrae y procesa datos para cada tabla del sistema
@@ -76,144 +351,412 @@ def extract_table_data(df):
     """
     tables = {}
     
-    # 1. TIPO_DOCUMENTO - Tabla de referencia para tipos de documentos
-    tables['tipo_documento'] = df[['id_tipo_documento', 'nombre', 'descripcion']]\
-        .dropna(subset=['id_tipo_documento'])\
-        .drop_duplicates()\
-        .rename(columns={'nombre': 'nombre', 'descripcion': 'descripcion'})
+    # Una proyección por tabla: filtrar por ID no nulo y deduplicar solo por ID
+    for table_name, (columns, rename) in TABLE_SCHEMAS.items():
+        id_column = f'id_{table_name}'
+        optional = {
+            source: target
+            for source, target in TABLE_OPTIONAL_COLUMNS.get(table_name, {}).items()
+            if source in df.columns
+        }
+        if optional:
+            columns = columns + list(optional)
+            rename = {**rename, **optional}
+        
+        table = df.loc[df[id_column].notna(), columns]
+        if table_name in REFERENCE_TABLES:
+            # Reducción por hash en C; sort=False conserva el orden de aparición
+            table = table.groupby(id_column, as_index=False, sort=False).first()
+        else:
+            table = table.drop_duplicates(subset=[id_column])
+        table = table.rename(columns=rename) if rename else table
+        
+        # Texto repetido (nombres, descripciones) como categoría: un código por fila
+        for column in table.columns:
+            if not column.startswith('id_') and pd.api.types.is_string_dtype(table[column]):
+                table[column] = table[column].astype('category')
+        tables[table_name] = table
     
-    # 2. CANAL_CLIENTE - Tipos de canales de venta
-    tables['canal_cliente'] = df[['id_canal_cliente', 'nombre.1', 'descripcion.1']]\
-        .dropna(subset=['id_canal_cliente'])\
-        .drop_duplicates()\
-        .rename(columns={'nombre.1': 'nombre', 'descripcion.1': 'descripcion'})
+    # Columnas adicionales necesarias (assign: solo se crea la columna nueva)
+    tables['marca_producto'] = tables['marca_producto'].assign(descripcion=lambda d: d['nombre_marca'])
+    tables['trabajador'] = tables['trabajador'].assign(apellidos='')
+    tables['detalle_pedido'] = tables['detalle_pedido'].assign(descuento=0)
     
-    # 3. TIPO_PAGO - Métodos de pago disponibles
-    tables['tipo_pago'] = df[['id_tipo_pago', 'nombre_tipo_pago', 'descripcion.2']]\
-        .dropna(subset=['id_tipo_pago'])\
-        .drop_duplicates()\
-        .rename(columns={'descripcion.2': 'descripcion'})
+    # IDs como enteros de 32 bits (INT en SQL Server) en lugar de float64 por los NaN
+    for table in tables.values():
+        for column in table.columns:
+            if column.startswith('id_') and pd.api.types.is_numeric_dtype(table[column]):
+                table[column] = table[column].astype('Int32')
     
-    # 4. CARGO_TRABAJADOR - Cargos del personal
-    tables['cargo_trabajador'] = df[['id_cargo_trabajador', 'nombre.2', 'descripcion.4']]\
-        .dropna(subset=['id_cargo_trabajador'])\
-        .drop_duplicates()\
-        .rename(columns={'nombre.2': 'nombre_cargo', 'descripcion.4': 'descripcion'})
+    return tables
+
+def iter_table_rows(df_table):
+    """
+    Genera las filas de un DataFrame como tuplas de parámetros para pyodbc
     
-    # 5. MARCA_PRODUCTO - Marcas de productos
-    tables['marca_producto'] = df[['id_marca_producto', 'nombre_marca']]\
-        .dropna(subset=['id_marca_producto'])\
-        .drop_duplicates()
-    tables['marca_producto']['descripcion'] = tables['marca_producto']['nombre_marca']
+    Los NA se envían como NULL y los escalares de numpy como tipos nativos de Python.
     
-    # 6. CATEGORIA_PRODUCTO - Categorías de productos
-    tables['categoria_producto'] = df[['id_categoria_producto', 'nombre_categoria', 'descripcion.5']]\
-        .dropna(subset=['id_categoria_producto'])\
-        .drop_duplicates()\
-        .rename(columns={'descripcion.5': 'descripcion'})
+    Args:
+        df_table: DataFrame con los datos de la tabla
+        
+    Yields:
+        tuple: Valores de una fila en el orden de las columnas
+    """
+    for row in df_table.itertuples(index=False, name=None):
+        yield tuple(
+            None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+            for value in row
+        )
+
+def insert_rows_in_batches(engine, table_name, df_table, batch_size=5000):
+    """
+    Inserta una tabla con executemany por lotes sin armar la lista completa de parámetros
     
-    # 7. TRABAJADOR - Personal de la empresa
-    tables['trabajador'] = df[['id_trabajador', 'nombre trabajador', 'correo', 'telefono.1', 'id_cargo_trabajador']]\
-        .dropna(subset=['id_trabajador'])\
-        .drop_duplicates()\
-        .rename(columns={
-            'nombre trabajador': 'nombres',
-            'correo': 'email', 
-            'telefono.1': 'telefono'
-        })
-    tables['trabajador']['apellidos'] = ''
+    Args:
+        engine: Conexión a la base de datos
+        table_name: Nombre de la tabla destino (schema G2)
+        df_table: DataFrame con los datos a insertar
+        batch_size: Filas por lote enviado al servidor
+    """
+    columns = ', '.join(df_table.columns)
+    placeholders = ', '.join('?' * len(df_table.columns))
+    insert_sql = f"INSERT INTO G2.{table_name} ({columns}) VALUES ({placeholders})"
     
-    # 8. CLIENTE - Base de clientes
-    tables['cliente'] = df[['id_cliente', 'nombre_cliente', 'numero_documento', 'correo.1', 'telefono.2', 'direccion', 'id_tipo_documento', 'id_canal_cliente']]\
-        .dropna(subset=['id_cliente'])\
-        .drop_duplicates()\
-        .rename(columns={
-            'correo.1': 'email',
-            'telefono.2': 'telefono'
-        })
+    rows = iter_table_rows(df_table)
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.fast_executemany = True
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cursor.executemany(insert_sql, batch)
+        raw_connection.commit()
+    finally:
+        raw_connection.close()
+
+def compute_load_layers(dependencies):
+    """
+    Agrupa las tablas en capas de carga (algoritmo de Kahn)
     
-    # 9. PRODUCTO - Catálogo de productos
-    tables['producto'] = df[['id_producto', 'descripcion.6', 'precio', 'id_marca_producto', 'id_categoria_producto']]\
-        .dropna(subset=['id_producto'])\
-        .drop_duplicates()\
-        .rename(columns={'descripcion.6': 'descripcion'})
-    # Agregar id_formato_producto si existe en tus datos
-    if 'codigo_formato_producto' in df.columns:
-        tables['producto']['id_formato_producto'] = df['codigo_formato_producto']
+    Las tablas de una misma capa no dependen entre sí y pueden cargarse en paralelo.
     
-    # 10. PEDIDO - Órdenes de compra
-    tables['pedido'] = df[['id_pedido', 'id_trabajador', 'id_cliente', 'id_tipo_pago', 'fecha', 'monto_total']]\
-        .dropna(subset=['id_pedido'])\
-        .drop_duplicates()
+    Args:
+        dependencies: Diccionario tabla -> lista de tablas padre
+        
+    Returns:
+        list: Lista de capas, cada una con los nombres de sus tablas
+    """
+    pending = {table: set(parents) for table, parents in dependencies.items()}
+    layers = []
     
-    # 11. DETALLE_PEDIDO - Líneas de cada pedido
-    tables['detalle_pedido'] = df[['id_detalle_pedido', 'id_pedido', 'id_producto', 'cantidad', 'precio_unitario']]\
-        .dropna(subset=['id_detalle_pedido'])\
-        .drop_duplicates()
+    while pending:
+        layer = [table for table, parents in pending.items() if not parents]
+        if not layer:
+            raise ValueError(f"Dependencia circular entre tablas: {sorted(pending)}")
+        layers.append(layer)
+        for table in layer:
+            del pending[table]
+        for parents in pending.values():
+            parents.difference_update(layer)
     
-    # Agregar columnas adicionales necesarias
-    if 'id_promocion' in df.columns:
-        tables['detalle_pedido']['id_promocion'] = df['id_promocion']
-    tables['detalle_pedido']['descuento'] = 0
+    return layers
+
+def set_foreign_key_checks(engine, enabled):
+    """
+    Desactiva o reactiva las foreign keys de las tablas dependientes
     
-    return tables
+    Al reactivarlas se usa WITH CHECK para revalidar todos los datos en un solo paso.
+    Cada tabla se reactiva en su propia transacción, padres antes que hijas. Si una
+    tabla tiene registros huérfanos, se eliminan todos sus registros (igual que si
+    la inserción hubiera sido rechazada) y se reactivan sus foreign keys; sus tablas
+    hijas fallan a su vez al revalidarse contra la tabla vacía.
+    
+    Args:
+        engine: Conexión a la base de datos
+        enabled: True para reactivar y revalidar, False para desactivar
+        
+    Returns:
+        dict: Error por tabla cuya reactivación falló (vacío si todas se aplicaron)
+    """
+    dependent_tables = [
+        table_name for table_name, parents in TABLE_DEPENDENCIES.items() if parents
+    ]
+    
+    if not enabled:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("\n".join(
+                f"ALTER TABLE G2.{table_name} NOCHECK CONSTRAINT ALL;"
+                for table_name in dependent_tables
+            ))
+        return {}
+    
+    errors = {}
+    for table_name in dependent_tables:
+        enable_sql = f"ALTER TABLE G2.{table_name} WITH CHECK CHECK CONSTRAINT ALL"
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(enable_sql)
+        except Exception as e:
+            errors[table_name] = e
+            print(f"✗ Foreign keys de {table_name} no válidas, se eliminan sus registros: {e}")
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"DELETE FROM G2.{table_name}")
+                conn.exec_driver_sql(enable_sql)
+    
+    return errors
 
-def load_data_to_database(tables_data, engine):
+def clear_external_foreign_keys(table_name, df_table):
+    """
+    Reemplaza por NULL las columnas que referencian tablas que no se cargan
+    
+    Args:
+        table_name: Nombre de la tabla
+        df_table: DataFrame con los datos de la tabla
+        
+    Returns:
+        DataFrame: Datos con esas columnas en NULL
+    """
+    columns = [
+        column for column, parent in EXTERNAL_FOREIGN_KEYS.get(table_name, {}).items()
+        if column in df_table.columns and parent not in TABLE_DEPENDENCIES
+    ]
+    if not columns:
+        return df_table
+    return df_table.assign(**{column: None for column in columns})
+
+def failed_parents(table_name, failed_tables):
+    """
+    Devuelve las tablas padre de table_name cuya carga falló
+    
+    Args:
+        table_name: Tabla a cargar
+        failed_tables: Conjunto de tablas con carga fallida u omitida
+        
+    Returns:
+        list: Tablas padre fallidas (vacía si se puede cargar)
+    """
+    return [parent for parent in TABLE_DEPENDENCIES[table_name] if parent in failed_tables]
+
+def load_data_to_database(tables_data, engine, max_workers=6):
     """
     Carga datos a la base de datos respetando dependencias de foreign keys
     
     Args:
         tables_data: Diccionario con DataFrames procesados
         engine: Conexión a la base de datos
+        max_workers: Máximo de tablas cargadas en paralelo dentro de una capa
         
     Returns:
         dict: Resultado de la carga por tabla
     """
     
-    # Orden de carga: tablas padre primero, dependientes después
-    load_order = [
-        'tipo_documento',
-        'canal_cliente',
-        'tipo_pago', 
-        'cargo_trabajador',
-        'marca_producto',
-        'categoria_producto',
-        'trabajador',
-        'cliente',
-        'producto',
-        'pedido',
-        'detalle_pedido'
-    ]
+    # Tablas de hechos: se cargan vía BCP cuando bcpandas y la utilidad bcp están disponibles
+    bulk_tables = ('pedido', 'detalle_pedido')
+    use_bcp = bcp_to_sql is not None and shutil.which('bcp') is not None
+    bcp_creds = create_bcp_credentials() if use_bcp else None
+    # Tablas grandes que, sin BCP, se insertan por lotes desde un generador
+    streamed_tables = ('detalle_pedido',)
     
-    results = {}
-    
-    for table_name in load_order:
-        if table_name in tables_data:
-            df_table = tables_data[table_name].copy()
+    # Se ejecuta en los hilos del pool: no imprime, devuelve los mensajes para el hilo principal
+    def load_table(table_name):
+        df_table = tables_data[table_name]
+        messages = []
+        
+        try:
+            # Remover ID para auto-incremento (si existe)
+            id_column = f'id_{table_name}'
+            if id_column in df_table.columns:
+                df_table = df_table.drop(columns=[id_column])
+            df_table = clear_external_foreign_keys(table_name, df_table)
             
-            try:
-                # Remover ID para auto-incremento (si existe)
-                id_column = f'id_{table_name}'
-                if id_column in df_table.columns:
-                    df_table = df_table.drop(columns=[id_column])
-                
-                # Carga por lotes para mejor rendimiento
+            loaded_with_bcp = False
+            if table_name in bulk_tables and bcp_creds is not None:
+                try:
+                    # BCP: protocolo de carga masiva, evita el procesador de consultas.
+                    # Sin batch_size, bcp confirma todo en un solo lote: si falla, no queda
+                    # nada insertado y se puede reintentar con executemany.
+                    bcp_to_sql(
+                        df_table,
+                        table_name,
+                        bcp_creds,
+                        schema='G2',
+                        index=False,
+                        if_exists='append'
+                    )
+                    loaded_with_bcp = True
+                except Exception as e:
+                    messages.append(f"⚠ BCP falló en {table_name}, se usa executemany: {e}")
+            
+            if not loaded_with_bcp and table_name in streamed_tables:
+                insert_rows_in_batches(engine, table_name, df_table)
+            elif not loaded_with_bcp:
+                # Carga por lotes con executemany (evita el límite de 2100 parámetros)
                 df_table.to_sql(
                     table_name,
                     index=False,
                     if_exists='append',
                     schema='G2',
                     con=engine,
-                    method='multi',
-                    chunksize=500
+                    method=None,
+                    chunksize=1000
                 )
+            
+            messages.append(f"✓ {table_name}: {len(df_table)} registros")
+            return True, f"✓ {len(df_table)} registros cargados", messages
+            
+        except Exception as e:
+            messages.append(f"✗ Error en {table_name}: {e}")
+            return False, f"✗ Error: {str(e)}", messages
+    
+    results = {}
+    failed_tables = set()
+    
+    # Sin validación de foreign keys fila por fila durante la carga masiva
+    set_foreign_key_checks(engine, enabled=False)
+    
+    try:
+        # Orden de carga: capa por capa (padres primero); cada capa en paralelo.
+        # Cada hilo toma su propia conexión del pool del engine.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for layer in compute_load_layers(TABLE_DEPENDENCIES):
+                layer = [table_name for table_name in layer if table_name in tables_data]
+                
+                # Con las foreign keys desactivadas, una tabla hija no debe cargarse
+                # si alguno de sus padres falló
+                runnable = []
+                for table_name in layer:
+                    parents = failed_parents(table_name, failed_tables)
+                    if parents:
+                        failed_tables.add(table_name)
+                        results[table_name] = f"✗ Omitida: falló la carga de {', '.join(parents)}"
+                        print(f"✗ {table_name} omitida: falló la carga de {', '.join(parents)}")
+                    else:
+                        runnable.append(table_name)
+                
+                for table_name, (loaded, result, messages) in zip(runnable, executor.map(load_table, runnable)):
+                    for message in messages:
+                        print(message)
+                    results[table_name] = result
+                    if not loaded:
+                        failed_tables.add(table_name)
+    finally:
+        # Revalidar todas las relaciones en un solo recorrido por tabla
+        fk_errors = set_foreign_key_checks(engine, enabled=True)
+        for table_name, error in fk_errors.items():
+            results[table_name] = f"✗ Foreign keys no válidas: {error}"
+    
+    return results
+
+def iter_excel_chunks(excel_file, sheet_name, chunk_size=10000):
+    """
+    Lee la hoja del Excel por bloques de filas con calamine (u openpyxl si no está instalado)
+    
+    Cada bloque pasa por el mismo parser que pd.read_excel (conversión numérica,
+    celdas vacías como NaN y columnas duplicadas como 'nombre.1').
+    
+    Args:
+        excel_file: Ruta del archivo Excel
+        sheet_name: Nombre de la hoja a leer
+        chunk_size: Filas por bloque
+        
+    Yields:
+        DataFrame: Bloque de filas con la segunda fila de la hoja como encabezado
+    """
+    try:
+        from python_calamine import CalamineWorkbook
+        rows = CalamineWorkbook.from_path(excel_file).get_sheet_by_name(sheet_name).iter_rows()
+    except ImportError:
+        # Sin python-calamine: openpyxl en modo de solo lectura también lee por filas
+        from openpyxl import load_workbook
+        workbook = load_workbook(excel_file, read_only=True, data_only=True)
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+    
+    # Misma convención que header=1: la primera fila se descarta
+    next(rows, None)
+    header = next(rows, None)
+    if header is None:
+        return
+    # Encabezados vacíos como '' para obtener 'Unnamed: N' igual que pd.read_excel
+    header = ['' if value is None else value for value in header]
+    
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield TextParser([header, *chunk], header=0).read()
+
+def stream_excel_to_database(excel_file, sheet_name, engine, chunk_size=10000):
+    """
+    Carga los datos leyendo el Excel por bloques, con memoria constante
+    
+    Cada bloque se extrae con extract_table_data y se inserta de inmediato;
+    los registros cuyo ID ya se cargó en un bloque anterior se descartan.
+    
+    Diferencia con la carga completa: las tablas de referencia se consolidan con
+    groupby().first() dentro de cada bloque, no sobre toda la hoja. Si un ID aparece
+    en varios bloques, se conservan los valores del primer bloque aunque tengan
+    atributos vacíos que un bloque posterior sí trae.
+    
+    Args:
+        excel_file: Ruta del archivo Excel
+        sheet_name: Nombre de la hoja a leer
+        engine: Conexión a la base de datos
+        chunk_size: Filas del Excel procesadas por bloque
+        
+    Returns:
+        dict: Resultado de la carga por tabla
+    """
+    seen_ids = {table_name: set() for table_name in TABLE_DEPENDENCIES}
+    loaded = {table_name: 0 for table_name in TABLE_DEPENDENCIES}
+    errors = {}
+    
+    # Los bloques mezclan tablas padre e hijas: las foreign keys se validan al final
+    set_foreign_key_checks(engine, enabled=False)
+    
+    try:
+        for chunk in iter_excel_chunks(excel_file, sheet_name, chunk_size):
+            tables_data = extract_table_data(chunk)
+            
+            for table_name in TABLE_DEPENDENCIES:
+                if table_name in errors or table_name not in tables_data:
+                    continue
+                
+                parents = failed_parents(table_name, errors)
+                if parents:
+                    errors[table_name] = f"Omitida: falló la carga de {', '.join(parents)}"
+                    print(f"✗ {table_name} omitida: falló la carga de {', '.join(parents)}")
+                    continue
                 
-                results[table_name] = f"✓ {len(df_table)} registros cargados"
-                print(f"✓ {table_name}: {len(df_table)} registros")
+                df_table = tables_data[table_name]
+                id_column = f'id_{table_name}'
+                df_table = df_table[~df_table[id_column].isin(seen_ids[table_name])]
+                if df_table.empty:
+                    continue
                 
-            except Exception as e:
-                results[table_name] = f"✗ Error: {str(e)}"
-                print(f"✗ Error en {table_name}: {e}")
+                try:
+                    seen_ids[table_name].update(df_table[id_column].tolist())
+                    df_table = clear_external_foreign_keys(table_name, df_table.drop(columns=[id_column]))
+                    insert_rows_in_batches(engine, table_name, df_table)
+                    loaded[table_name] += len(df_table)
+                except Exception as e:
+                    errors[table_name] = e
+                    print(f"✗ Error en {table_name}: {e}")
+                    # Descartar lo cargado en bloques anteriores: la tabla queda vacía
+                    # como en la carga completa, y sus hijas fallan al revalidarse
+                    with engine.begin() as conn:
+                        conn.exec_driver_sql(f"DELETE FROM G2.{table_name}")
+    finally:
+        errors.update(set_foreign_key_checks(engine, enabled=True))
+    
+    results = {}
+    for table_name, count in loaded.items():
+        if table_name in errors:
+            results[table_name] = f"✗ Error: {str(errors[table_name])}"
+        else:
+            results[table_name] = f"✓ {count} registros cargados"
+            print(f"✓ {table_name}: {count} registros")
     
     return results
 
@@ -232,17 +775,34 @@ def validate_data_integrity(engine):
         'G2.pedido', 'G2.detalle_pedido'
     ]
     
+    # Todos los conteos en una sola consulta (un viaje al servidor)
+    count_sql = " UNION ALL ".join(
+        f"SELECT '{table}' AS tabla, COUNT_BIG(*) AS registros FROM {table}"
+        for table in tables_to_check
+    )
+    
     counts = {}
     
     with engine.connect() as conn:
-        for table in tables_to_check:
-            try:
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table}"))
-                count = result.scalar()
-                counts[table] = count
-                print(f"{table}: {count} registros")
-            except Exception as e:
-                counts[table] = f"Error: {e}"
+        try:
+            rows = conn.execute(text(count_sql)).all()
+            counts_by_table = {row.tabla: row.registros for row in rows}
+            for table in tables_to_check:
+                counts[table] = counts_by_table[table]
+                print(f"{table}: {counts[table]} registros")
+        except Exception:
+            # Si falla la consulta conjunta, contar tabla por tabla para que un
+            # error en una tabla no oculte los conteos de las demás
+            conn.rollback()
+            for table in tables_to_check:
+                try:
+                    result = conn.execute(text(f"SELECT COUNT(*) FROM {table}"))
+                    count = result.scalar()
+                    counts[table] = count
+                    print(f"{table}: {count} registros")
+                except Exception as e:
+                    conn.rollback()
+                    counts[table] = f"Error: {e}"
     
     return counts
 
@@ -255,10 +815,10 @@ def create_database_schema(engine):
     """
     
     # DDL para crear todas las tablas del sistema
-    schema_sql = """
-    -- Crear schema G2
-    CREATE SCHEMA G2;
+    # CREATE SCHEMA debe ser la única sentencia de su lote en T-SQL
+    create_schema_sql = "CREATE SCHEMA G2"
     
+    schema_sql = """
     -- Tabla: tipo_documento
     CREATE TABLE G2.tipo_documento (
         id_tipo_documento INT IDENTITY(1,1) PRIMARY KEY,
@@ -396,21 +956,25 @@ def create_database_schema(engine):
     """
     
     try:
-        with engine.connect() as conn:
-            # Ejecutar cada comando DDL
-            for statement in schema_sql.split(';'):
-                if statement.strip():
-                    conn.execute(text(statement.strip()))
-            conn.commit()
+        with engine.begin() as conn:
+            # Enviar el DDL completo como un solo lote T-SQL (un viaje al servidor)
+            conn.exec_driver_sql(create_schema_sql)
+            conn.exec_driver_sql(schema_sql)
         print("   ✓ Base de datos AJE creada exitosamente")
         return True
     except Exception as e:
         print(f"   ✗ Error creando base de datos: {e}")
         return False
 
-def main():
+def main(streaming_load=False, snapshot_dir=None):
     """
     Configuración completa del proyecto AJE desde cero
+    
+    Args:
+        streaming_load: True para leer el Excel por bloques e insertarlos al vuelo
+            (memoria constante) en lugar de cargar la hoja completa
+        snapshot_dir: Carpeta para instantáneas reflink de cada caché Parquet nueva
+            (None: no guardar instantáneas)
     """
     print("=" * 60)
     print("PROYECTO AJE - CONFIGURACIÓN INICIAL DE BASE DE DATOS")
@@ -422,6 +986,7 @@ def main():
     # Configuración de archivos
     excel_file = 'TablasGrupo2.xlsx'
     data_sheet = 'tablas'
+    cache_file = 'TablasGrupo2.parquet'
     
     try:
         # 1. Verificar prerrequisitos
@@ -432,35 +997,61 @@ def main():
             return False
         print("   ✓ Archivo de datos encontrado")
         
-        # 2. Conectar a base de datos
+        # 2. Conectar a base de datos (valida DATABASE_CONFIG antes de leer datos)
         print("2. Conectando a SQL Server Azure...")
         engine = create_connection()
         print("   ✓ Conexión establecida")
         
+        if not streaming_load:
+            # La lectura del Excel (CPU) se solapa con el DDL (red)
+            reader, read_outcome = start_background_read(excel_file, data_sheet, cache_file, snapshot_dir)
+        
         # 3. Crear estructura de base de datos
         print("3. Creando estructura de base de datos...")
         if not create_database_schema(engine):
             return False
         
-        # 4. Leer datos del Excel
-        print("4. Procesando archivo de datos...")
-        df = pd.read_excel(excel_file, sheet_name=data_sheet, header=1)
-        print(f"   ✓ {len(df):,} registros procesados")
-        
-        # 5. Extraer datos por tabla
-        print("5. Organizando datos por tabla...")
-        tables_data = extract_table_data(df)
-        print(f"   ✓ {len(tables_data)} tablas preparadas")
-        
-        # 6. Cargar datos
-        print("6. Cargando datos a la base de datos...")
-        results = load_data_to_database(tables_data, engine)
+        if streaming_load:
+            # 4-6. Leer, organizar y cargar los datos bloque por bloque
+            print("4-6. Cargando datos por bloques desde el archivo...")
+            results = stream_excel_to_database(excel_file, data_sheet, engine)
+        else:
+            # 4. Leer datos del Excel
+            print("4. Procesando archivo de datos...")
+            reader.join()
+            if 'error' in read_outcome:
+                raise read_outcome['error']
+            df = read_outcome['df']
+            print(f"   ✓ {len(df):,} registros procesados")
+            
+            # 5. Extraer datos por tabla
+            print("5. Organizando datos por tabla...")
+            tables_data = extract_table_data(df)
+            print(f"   ✓ {len(tables_data)} tablas preparadas")
+            
+            # 6. Cargar datos
+            print("6. Cargando datos a la base de datos...")
+            results = load_data_to_database(tables_data, engine)
         
         # 7. Validar instalación
         print("7. Validando instalación...")
         counts = validate_data_integrity(engine)
         
         # 8. Resumen final
+        failed = {table: result for table, result in results.items() if result.startswith('✗')}
+        if failed:
+            print("\n" + "=" * 60)
+            print("CONFIGURACIÓN INCOMPLETA")
+            print("=" * 60)
+            print("Tablas con errores (sin registros cargados):")
+            for table, result in failed.items():
+                print(f"  {table:<25}: {result}")
+            print("")
+            print("DATOS CARGADOS:")
+            for table, count in counts.items():
+                print(f"  {table:<25}: {count:>8} registros")
+            return False
+        
         print("\n" + "=" * 60)
         print("CONFIGURACIÓN COMPLETADA EXITOSAMENTE")
         print("=" * 60)
@@ -470,7 +1061,8 @@ def main():
         for table, count in counts.items():
             print(f"  {table:<25}: {count:>8} registros")
         
-        print(f"\nTOTAL: {sum(int(c) for c in counts.values() if str(c).isdigit()):,} registros")
+        total = sum(c for c in counts.values() if isinstance(c, int))
+        print(f"\nTOTAL: {total:,} registros")
         print("\n✓ Puedes conectar Power Apps a esta base de datos")
         print("✓ Todas las tablas y relaciones están configuradas")
         
@@ -510,7 +1102,21 @@ def main():
     return True
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description="Configuración inicial de la base de datos AJE")
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help="leer el Excel por bloques e insertarlos al vuelo (memoria constante)"
+    )
+    parser.add_argument(
+        '--snapshots',
+        metavar='DIR',
+        default=None,
+        help="guardar en DIR una instantánea reflink de cada caché Parquet nueva"
+    )
+    args = parser.parse_args()
+    
+    success = main(streaming_load=args.streaming, snapshot_dir=args.snapshots)
     if success:
         print("\n🎉 Base de datos AJE configurada correctamente")
     else: